@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for AgriSmart
+Loaded automatically from the working directory by gunicorn
+"""
+
+import os
+import sys
+
+# Read by app_prod at import: skip GEE initialization in the master, since
+# each worker initializes its own client in post_worker_init below
+os.environ['AGRISMART_GEE_PER_WORKER'] = '1'
+
+
+def post_worker_init(worker):
+    """Initialize a GEE client owned by this worker"""
+    # Runs after the worker has the app, with or without --preload
+    app_prod = sys.modules.get('src.app_prod')
+    if app_prod is not None:
+        app_prod.init_gee_integration()
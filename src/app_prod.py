@@ -4,12 +4,45 @@ AgriSmart Flask API with GEE Integration - Production Version
 Deployment-ready API for farmers and officials with Google Earth Engine support
 """
 
-from flask import Flask, request, jsonify, render_template_string
+import os
+
+# AGRISMART_IMPORT_ONLY=1 imports the module without any process-wide startup
+# work (monkey-patching, GEE init); used by deploy_to_render.py's import check
+IMPORT_ONLY = os.environ.get('AGRISMART_IMPORT_ONLY') == '1'
+
+# Patch blocking I/O before anything else imports it, so Earth Engine HTTP
+# calls yield to other requests under gunicorn gevent workers
+if not IMPORT_ONLY:
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        pass
+
+from flask import Flask, Response, request, jsonify, render_template_string
+from flask.json.provider import JSONProvider
 import numpy as np
+import orjson
 import json
-import os
-from datetime import datetime
+import functools
+import hashlib
+import hmac
+import math
+import importlib.util
+import time
+from datetime import datetime, timezone
 import logging
+from threading import Lock
+from cachetools import TTLCache
+
+try:
+    import numexpr as ne
+    NUMEXPR_AVAILABLE = True
+except ImportError:
+    NUMEXPR_AVAILABLE = False
+
+# Only locate numba here; it (and llvmlite) is imported on the first fused call
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
 
 # Configure logging for production
 logging.basicConfig(level=logging.INFO)
@@ -21,15 +54,32 @@ load_dotenv()  # This ensures os.getenv() reads from .env
 import sys
 sys.path.append(os.path.dirname(__file__))
 
-try:
-    from gee_integration import GEEIntegration
-    GEE_AVAILABLE = True
-    logger.info("✅ GEE module imported successfully")
-except ImportError as e:
-    GEE_AVAILABLE = False
-    logger.error(f"❌ GEE module import failed: {e}")
+# Only locate the module here; the import (ee, google.auth) is deferred to
+# load_trained_models()
+GEE_AVAILABLE = importlib.util.find_spec('gee_integration') is not None
+if not GEE_AVAILABLE:
+    logger.error("❌ GEE module not found")
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (handles numpy scalars and datetimes)"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=ORJSON_OPTIONS),
+            mimetype='application/json'
+        )
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # Global variables for models
 growth_stage_model = None
@@ -37,6 +87,64 @@ nitrogen_model = None
 cnn_model = None
 gee_integration = None
 
+# GEE connection status, resolved once by load_trained_models()
+_GEE_OK = False
+
+CNN_MODEL_PATH = 'outputs/potato_growth_cnn.h5'
+
+# Sample dashboard data (in practice, this would be from a database)
+DASHBOARD_SAMPLE_DATA = {
+    'total_farmers': 150,
+    'total_area_ha': 2500,
+    'average_nitrogen': 115.5,
+    'growth_stage_distribution': {
+        'vegetative': 45,
+        'tuber_initiation': 60,
+        'tuber_bulking': 35,
+        'maturation': 10
+    },
+    'recommendations_generated': 150,
+    'yield_prediction': '22.5 tons/ha'
+}
+
+# GEE prediction cache keyed on (lat, lon) grid cell (~1 km) and ISO week
+GEE_CACHE_TTL_SECONDS = 6 * 3600
+_gee_cache = TTLCache(maxsize=4096, ttl=GEE_CACHE_TTL_SECONDS)
+_gee_cache_lock = Lock()
+
+# Per-process RNG for nitrogen noise (avoids the legacy global RNG lock)
+_rng = None
+_rng_pid = None
+
+def _get_rng():
+    """Return this process's Generator, creating a fresh one after a fork
+
+    Under gunicorn --preload the module is imported in the master, so a
+    Generator created at import would be copied into every worker and all
+    workers would draw the same sequence.
+    """
+    global _rng, _rng_pid
+    pid = os.getpid()
+    if _rng_pid != pid:
+        _rng = np.random.default_rng()
+        _rng_pid = pid
+    return _rng
+
+# Response timestamp cache: [epoch second, formatted string]
+_ts_cache = [0, '']
+
+def _iso_now():
+    """Current UTC time as an ISO 8601 string, formatted at most once per second
+
+    Concurrent callers may both reformat the same second; either result is
+    identical, so the race is benign.
+    """
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache[1] = datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        _ts_cache[0] = now
+    return _ts_cache[1]
+
 # Nutrient thresholds
 NUTRIENT_THRESHOLDS = {
     'nitrogen_low': 80,
@@ -44,118 +152,40 @@ NUTRIENT_THRESHOLDS = {
     'nitrogen_high': 160
 }
 
-def load_trained_models():
-    """Load the trained models"""
-    global growth_stage_model, nitrogen_model, cnn_model, gee_integration
-    
-    try:
-        logger.info("Loading trained models...")
-        
-        # Load CNN model if available
-        if os.path.exists('outputs/potato_growth_cnn.h5'):
-            try:
-                import tensorflow as tf
-                cnn_model = tf.keras.models.load_model('outputs/potato_growth_cnn.h5')
-                logger.info("CNN model loaded successfully")
-            except Exception as e:
-                logger.warning(f"Could not load CNN model: {e}")
-        
-        # Load training results to understand model performance
-        if os.path.exists('outputs/training_summary.json'):
-            with open('outputs/training_summary.json', 'r') as f:
-                training_summary = json.load(f)
-                logger.info(f"Training summary loaded: {training_summary.get('model_performance', 'N/A')}")
-        
-        # Initialize GEE integration
-        if GEE_AVAILABLE:
-            try:
-                logger.info("🔄 Initializing GEE integration...")
-                gee_integration = GEEIntegration()
-                logger.info("✅ GEE integration initialized successfully")
-            except Exception as e:
-                logger.error(f"❌ GEE initialization failed: {e}")
-                gee_integration = None
-        else:
-            logger.warning("⚠️ GEE not available, skipping initialization")
-            gee_integration = None
-        
-        return True
-    except Exception as e:
-        logger.error(f"Error loading models: {e}")
-        return False
-
-def compute_vegetation_indices(bands):
-    """Compute vegetation indices from bands"""
-    indices = {}
-    
-    # NDVI = (NIR - Red) / (NIR + Red)
-    if 'B08' in bands and 'B04' in bands:
-        nir = bands['B08'].astype(float)
-        red = bands['B04'].astype(float)
-        indices['NDVI'] = (nir - red) / (nir + red + 1e-8)
-        indices['NDVI'] = np.clip(indices['NDVI'], -1, 1)
-    
-    # NDRE = (NIR - Red Edge) / (NIR + Red Edge)
-    if 'B08' in bands and 'B05' in bands:
-        nir = bands['B08'].astype(float)
-        red_edge = bands['B05'].astype(float)
-        indices['NDRE'] = (nir - red_edge) / (nir + red_edge + 1e-8)
-        indices['NDRE'] = np.clip(indices['NDRE'], -1, 1)
-    
-    # EVI = 2.5 * (NIR - Red) / (NIR + 6*Red - 7.5*Blue + 1)
-    if all(b in bands for b in ['B08', 'B04', 'B02']):
-        nir = bands['B08'].astype(float)
-        red = bands['B04'].astype(float)
-        blue = bands['B02'].astype(float)
-        indices['EVI'] = 2.5 * (nir - red) / (nir + 6*red - 7.5*blue + 1)
-        indices['EVI'] = np.clip(indices['EVI'], -1, 1)
-    
-    return indices
+# Growth stages by NDVI: < 0.3, < 0.5, < 0.7, >= 0.7
+GROWTH_STAGES = ('vegetative', 'tuber_initiation', 'tuber_bulking', 'maturation')
+NDVI_STAGE_CUTS = np.array([0.3, 0.5, 0.7])
 
-def generate_recommendations(growth_stage, nitrogen_level):
-    """Generate irrigation and fertilizer recommendations"""
-    recommendations = {
-        'growth_stage': growth_stage,
-        'nitrogen_level': nitrogen_level,
-        'nitrogen_status': 'low' if nitrogen_level < NUTRIENT_THRESHOLDS['nitrogen_low'] else 
-                          'medium' if nitrogen_level < NUTRIENT_THRESHOLDS['nitrogen_medium'] else 'high',
-        'recommendations': {}
+# Stage-specific recommendations; fertilizer text is formatted with the N deficit
+STAGE_RECOMMENDATIONS = {
+    'vegetative': {
+        'irrigation': 'Apply 1500-2000 L/ha weekly, maintain soil moisture',
+        'fertilizer_N_target': 120,
+        'fertilizer': 'Apply {n_deficit:.0f} kg/ha N as basal dose',
+        'management': 'Focus on leaf development, control weeds'
+    },
+    'tuber_initiation': {
+        'irrigation': 'Apply 2000-2500 L/ha weekly, critical for tuber formation',
+        'fertilizer_N_target': 140,
+        'fertilizer': 'Apply {n_deficit:.0f} kg/ha N as top dressing',
+        'management': 'Ensure adequate soil moisture, monitor for pests'
+    },
+    'tuber_bulking': {
+        'irrigation': 'Apply 2500-3000 L/ha weekly, maximum water requirement',
+        'fertilizer_N_target': 160,
+        'fertilizer': 'Apply {n_deficit:.0f} kg/ha N + 60 kg/ha K',
+        'management': 'Critical stage for yield, maintain optimal conditions'
+    },
+    'maturation': {
+        'irrigation': 'Reduce to 1000-1500 L/ha, prepare for harvest',
+        'fertilizer_N_target': 0,
+        'fertilizer': 'No additional N required, focus on K for quality',
+        'management': 'Prepare for harvest, monitor for diseases'
     }
-    
-    # Stage-specific recommendations
-    if growth_stage == 'vegetative':
-        recommendations['recommendations'] = {
-            'irrigation': 'Apply 1500-2000 L/ha weekly, maintain soil moisture',
-            'fertilizer': f"Apply {max(0, 120 - nitrogen_level):.0f} kg/ha N as basal dose",
-            'management': 'Focus on leaf development, control weeds'
-        }
-    elif growth_stage == 'tuber_initiation':
-        recommendations['recommendations'] = {
-            'irrigation': 'Apply 2000-2500 L/ha weekly, critical for tuber formation',
-            'fertilizer': f"Apply {max(0, 140 - nitrogen_level):.0f} kg/ha N as top dressing",
-            'management': 'Ensure adequate soil moisture, monitor for pests'
-        }
-    elif growth_stage == 'tuber_bulking':
-        recommendations['recommendations'] = {
-            'irrigation': 'Apply 2500-3000 L/ha weekly, maximum water requirement',
-            'fertilizer': f"Apply {max(0, 160 - nitrogen_level):.0f} kg/ha N + 60 kg/ha K",
-            'management': 'Critical stage for yield, maintain optimal conditions'
-        }
-    elif growth_stage == 'maturation':
-        recommendations['recommendations'] = {
-            'irrigation': 'Reduce to 1000-1500 L/ha, prepare for harvest',
-            'fertilizer': 'No additional N required, focus on K for quality',
-            'management': 'Prepare for harvest, monitor for diseases'
-        }
-    
-    return recommendations
+}
 
-@app.route('/')
-def home():
-    """Home page with API documentation"""
-    gee_status = '✅ Connected' if GEE_AVAILABLE and gee_integration else '❌ Not Available'
-    
-    html = f"""
+# Page templates, rendered once at import by render_static_pages()
+HOME_TEMPLATE = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -210,113 +240,20 @@ curl -X POST https://your-app.onrender.com/predict-gee \\
     </body>
     </html>
     """
-    return html
-
-@app.route('/predict-gee', methods=['POST'])
-def predict_gee():
-    """Predict using Google Earth Engine data (supports lat/lon AOI)"""
-    if not GEE_AVAILABLE or not gee_integration:
-        return jsonify({'error': 'GEE integration not available'}), 400
-    
-    try:
-        data = request.get_json() or {}
-        use_gee = data.get('use_gee', True)
-        
-        if not use_gee:
-            return jsonify({'error': 'GEE prediction requested but use_gee is False'}), 400
-        
-        # Optional AOI from lat/lon (1km buffer) when in Live mode
-        aoi = None
-        lat = data.get('lat')
-        lon = data.get('lon')
-        if lat is not None and lon is not None:
-            try:
-                import ee
-                aoi = ee.Geometry.Point([float(lon), float(lat)]).buffer(1000)
-            except Exception:
-                aoi = None
-        
-        # Get GEE data (Live if available, Demo otherwise)
-        gee_image = gee_integration.get_weekly_sentinel2_data(aoi=aoi)
-        
-        # Get summary statistics
-        summary = gee_integration.get_weekly_summary(gee_image)
-        
-        # Generate predictions based on NDVI
-        ndvi_mean = summary['ndvi_mean']
-        
-        # Predict growth stage based on NDVI
-        if ndvi_mean < 0.3:
-            growth_stage = 'vegetative'
-        elif ndvi_mean < 0.5:
-            growth_stage = 'tuber_initiation'
-        elif ndvi_mean < 0.7:
-            growth_stage = 'tuber_bulking'
-        else:
-            growth_stage = 'maturation'
-        
-        # Predict nitrogen level
-        nitrogen_level = 80 + (ndvi_mean * 100) + np.random.normal(0, 10)
-        nitrogen_level = np.clip(nitrogen_level, 40, 200)
-        
-        # Generate recommendations
-        recommendations = generate_recommendations(growth_stage, nitrogen_level)
-        
-        return jsonify({
-            'success': True,
-            'predictions': {
-                'growth_stage': growth_stage,
-                'nitrogen_level': float(nitrogen_level),
-                'ndvi_mean': float(ndvi_mean)
-            },
-            'recommendations': recommendations,
-            'timestamp': datetime.now().isoformat(),
-            'data_source': 'Google Earth Engine',
-            'gee_summary': summary
-        })
-        
-    except Exception as e:
-        logger.error(f"Error in predict_gee: {e}")
-        return jsonify({'error': str(e)}), 500
 
-@app.route('/dashboard')
-def dashboard():
-    """Dashboard for officials to view aggregated data"""
-    try:
-        # Load sample data (in practice, this would be from a database)
-        sample_data = {
-            'total_farmers': 150,
-            'total_area_ha': 2500,
-            'average_nitrogen': 115.5,
-            'growth_stage_distribution': {
-                'vegetative': 45,
-                'tuber_initiation': 60,
-                'tuber_bulking': 35,
-                'maturation': 10
-            },
-            'recommendations_generated': 150,
-            'yield_prediction': '22.5 tons/ha',
-            'gee_integration': {
-                'enabled': GEE_AVAILABLE,
-                'data_quality': 'cloud_masked' if GEE_AVAILABLE else 'standard'
-            }
-        }
-        
-        gee_status = 'Connected' if GEE_AVAILABLE else 'Not Available'
-        
-        html = f"""
+DASHBOARD_TEMPLATE = """
         <!DOCTYPE html>
         <html>
         <head>
             <title>AgriSmart Dashboard</title>
             <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
-                .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 10px; }}
-                .stats {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 20px; margin-bottom: 30px; }}
-                .stat-card {{ background: #f8f9fa; padding: 20px; border-radius: 8px; text-align: center; border-left: 4px solid #28a745; }}
-                .stat-value {{ font-size: 2em; font-weight: bold; color: #28a745; }}
-                .stat-label {{ color: #6c757d; margin-top: 5px; }}
-                .gee-status {{ background: #e7f3ff; padding: 10px; border-radius: 5px; margin: 10px 0; }}
+                body { font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }
+                .container { max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 10px; }
+                .stats { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 20px; margin-bottom: 30px; }
+                .stat-card { background: #f8f9fa; padding: 20px; border-radius: 8px; text-align: center; border-left: 4px solid #28a745; }
+                .stat-value { font-size: 2em; font-weight: bold; color: #28a745; }
+                .stat-label { color: #6c757d; margin-top: 5px; }
+                .gee-status { background: #e7f3ff; padding: 10px; border-radius: 5px; margin: 10px 0; }
             </style>
         </head>
         <body>
@@ -325,24 +262,24 @@ def dashboard():
                 <p><strong>Real-time Potato Crop Management Analytics</strong></p>
                 
                 <div class="gee-status">
-                    <strong>🌍 Google Earth Engine Status:</strong> {gee_status}
+                    <strong>🌍 Google Earth Engine Status:</strong> {{ gee_status }}
                 </div>
                 
                 <div class="stats">
                     <div class="stat-card">
-                        <div class="stat-value">{sample_data['total_farmers']}</div>
+                        <div class="stat-value">{{ data.total_farmers }}</div>
                         <div class="stat-label">Active Farmers</div>
                     </div>
                     <div class="stat-card">
-                        <div class="stat-value">{sample_data['total_area_ha']} ha</div>
+                        <div class="stat-value">{{ data.total_area_ha }} ha</div>
                         <div class="stat-label">Total Area</div>
                     </div>
                     <div class="stat-card">
-                        <div class="stat-value">{sample_data['average_nitrogen']} kg/ha</div>
+                        <div class="stat-value">{{ data.average_nitrogen }} kg/ha</div>
                         <div class="stat-label">Avg Nitrogen</div>
                     </div>
                     <div class="stat-card">
-                        <div class="stat-value">{sample_data['yield_prediction']}</div>
+                        <div class="stat-value">{{ data.yield_prediction }}</div>
                         <div class="stat-label">Predicted Yield</div>
                     </div>
                 </div>
@@ -357,31 +294,436 @@ def dashboard():
         </body>
         </html>
         """
+
+# Compiled once with the app's Jinja environment (autoescaped)
+_DASHBOARD_TPL = app.jinja_env.from_string(DASHBOARD_TEMPLATE)
+
+def render_static_pages():
+    """Render the home and dashboard pages for both GEE states as encoded bytes"""
+    home_pages = {}
+    dashboard_pages = {}
+    for gee_ok in (True, False):
+        home_status = '✅ Connected' if gee_ok else '❌ Not Available'
+        home_pages[gee_ok] = HOME_TEMPLATE.format(gee_status=home_status).encode('utf-8')
         
-        return html
-        
+        dashboard_status = 'Connected' if gee_ok else 'Not Available'
+        dashboard_data = dict(DASHBOARD_SAMPLE_DATA, gee_integration={
+            'enabled': gee_ok,
+            'data_quality': 'cloud_masked' if gee_ok else 'standard'
+        })
+        dashboard_pages[gee_ok] = _DASHBOARD_TPL.render(
+            gee_status=dashboard_status,
+            data=dashboard_data
+        ).encode('utf-8')
+    return home_pages, dashboard_pages
+
+# Rendered page bytes and their ETags keyed by _GEE_OK
+_HOME_PAGES, _DASHBOARD_PAGES = render_static_pages()
+_HOME_ETAGS = {k: hashlib.blake2s(v, digest_size=8).hexdigest() for k, v in _HOME_PAGES.items()}
+_DASHBOARD_ETAGS = {k: hashlib.blake2s(v, digest_size=8).hexdigest() for k, v in _DASHBOARD_PAGES.items()}
+PAGE_CACHE_MAX_AGE = 60
+
+def cached_page_response(body, etag):
+    """Serve a prerendered page with an ETag, answering conditional GETs with 304"""
+    resp = Response(body, mimetype='text/html')
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = PAGE_CACHE_MAX_AGE
+    return resp.make_conditional(request)
+
+@functools.lru_cache(maxsize=1)
+def get_cnn_model():
+    """Load the CNN model on first use (keeps TensorFlow out of worker startup)"""
+    global cnn_model
+    
+    if not os.path.exists(CNN_MODEL_PATH):
+        return None
+    
+    try:
+        import tensorflow as tf
+        cnn_model = tf.keras.models.load_model(CNN_MODEL_PATH, compile=False)
+        logger.info("CNN model loaded successfully")
     except Exception as e:
-        logger.error(f"Error in dashboard: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.warning(f"Could not load CNN model: {e}")
+    return cnn_model
 
-@app.route('/health')
-def health():
-    """Health check endpoint"""
-    models_loaded = growth_stage_model is not None or nitrogen_model is not None or cnn_model is not None
+def _build_health_prefix():
+    """Serialize the static /health fields once, leaving the timestamp open"""
+    global _HEALTH_PREFIX
     
-    return jsonify({
+    # The CNN loads lazily, so count it as loaded when its weights are available
+    cnn_available = cnn_model is not None or os.path.exists(CNN_MODEL_PATH)
+    models_loaded = growth_stage_model is not None or nitrogen_model is not None or cnn_available
+    static = orjson.dumps({
         'status': 'healthy',
         'models_loaded': models_loaded,
         'gee_available': GEE_AVAILABLE,
-        'gee_connected': gee_integration is not None,
-        'timestamp': datetime.now().isoformat(),
+        'gee_connected': _GEE_OK,
         'version': '1.0.0'
     })
+    _HEALTH_PREFIX = static[:-1] + b',"timestamp":"'
 
-if __name__ == '__main__':
-    # Load models on startup
+_build_health_prefix()
+
+def init_gee_integration():
+    """Import and initialize GEE integration, then refresh the cached status
+
+    Under gunicorn this runs only in each worker (post_worker_init hook in
+    gunicorn.conf.py), so every worker owns its Earth Engine HTTP/auth client
+    and the master makes no GEE network calls.
+    """
+    global gee_integration, _GEE_OK, GEE_AVAILABLE
+    
+    if GEE_AVAILABLE:
+        try:
+            from gee_integration import GEEIntegration
+            logger.info("✅ GEE module imported successfully")
+        except ImportError as e:
+            logger.error(f"❌ GEE module import failed: {e}")
+            GEE_AVAILABLE = False
+    
+    if GEE_AVAILABLE:
+        try:
+            logger.info("🔄 Initializing GEE integration...")
+            gee_integration = GEEIntegration()
+            logger.info("✅ GEE integration initialized successfully")
+        except Exception as e:
+            logger.error(f"❌ GEE initialization failed: {e}")
+            gee_integration = None
+    else:
+        logger.warning("⚠️ GEE not available, skipping initialization")
+        gee_integration = None
+    
+    _GEE_OK = bool(GEE_AVAILABLE and gee_integration)
+    _build_health_prefix()
+
+def load_trained_models():
+    """Load the trained models"""
+    global growth_stage_model, nitrogen_model
+    
+    try:
+        logger.info("Loading trained models...")
+        
+        # CNN model is loaded on first use by get_cnn_model()
+        if os.path.exists(CNN_MODEL_PATH):
+            logger.info("CNN model found, deferring load until first use")
+        
+        # Load training results to understand model performance
+        if os.path.exists('outputs/training_summary.json'):
+            with open('outputs/training_summary.json', 'r') as f:
+                training_summary = json.load(f)
+                logger.info(f"Training summary loaded: {training_summary.get('model_performance', 'N/A')}")
+        
+        # Under gunicorn each worker initializes GEE itself (gunicorn.conf.py)
+        if os.environ.get('AGRISMART_GEE_PER_WORKER') == '1':
+            logger.info("GEE initialization deferred to worker startup")
+        else:
+            init_gee_integration()
+        
+        return True
+    except Exception as e:
+        logger.error(f"Error loading models: {e}")
+        return False
+
+def _as_dtype(band, dtype):
+    """Return band as an array of dtype, copying only if the dtype differs"""
+    if isinstance(band, np.ndarray) and band.dtype == dtype:
+        return band
+    return np.asarray(band).astype(dtype, copy=False)
+
+@functools.lru_cache(maxsize=1)
+def _get_fused_kernel():
+    """Import numba and compile the fused kernel on first use (None if unavailable)"""
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+    
+    # error_model='numpy' gives inf/NaN on division by zero like the NumPy
+    # path; fastmath flags are limited to ones that keep NaN/inf semantics
+    @njit(
+        parallel=True,
+        fastmath={'contract', 'arcp', 'reassoc'},
+        error_model='numpy',
+        cache=True
+    )
+    def _veg_indices_fused(nir, red, red_edge, blue, ndvi, ndre, evi):
+        """NDVI, NDRE and EVI in one pass over flat band arrays
+
+        Clipping uses comparisons so NaN pixels stay NaN, as with np.clip.
+        """
+        for i in prange(nir.size):
+            n = nir[i]
+            r = red[i]
+            re = red_edge[i]
+            b = blue[i]
+            x = (n - r) / (n + r + 1e-8)
+            ndvi[i] = -1.0 if x < -1.0 else (1.0 if x > 1.0 else x)
+            x = (n - re) / (n + re + 1e-8)
+            ndre[i] = -1.0 if x < -1.0 else (1.0 if x > 1.0 else x)
+            x = 2.5 * (n - r) / (n + 6 * r - 7.5 * b + 1)
+            evi[i] = -1.0 if x < -1.0 else (1.0 if x > 1.0 else x)
+    
+    return _veg_indices_fused
+
+def _compute_vegetation_indices_fused(kernel, nir, red, red_edge, blue):
+    """Run the fused Numba kernel and reshape outputs to the band shape"""
+    flat = [np.ascontiguousarray(band).ravel() for band in (nir, red, red_edge, blue)]
+    ndvi, ndre, evi = (np.empty_like(flat[0]) for _ in range(3))
+    kernel(*flat, ndvi, ndre, evi)
+    return {
+        'NDVI': ndvi.reshape(nir.shape),
+        'NDRE': ndre.reshape(nir.shape),
+        'EVI': evi.reshape(nir.shape)
+    }
+
+def compute_vegetation_indices(bands, dtype=np.float32):
+    """Compute vegetation indices from bands
+
+    Each band is converted to ``dtype`` exactly once (no copy if already that
+    dtype) and each index is written into a preallocated buffer with in-place
+    ufuncs.
+    """
+    indices = {}
+    
+    nir, red, red_edge, blue = (
+        _as_dtype(bands[b], dtype) if b in bands else None
+        for b in ('B08', 'B04', 'B05', 'B02')
+    )
+    
+    # All three indices in one pass when Numba is available (NIR read once)
+    all_bands = (nir, red, red_edge, blue)
+    if NUMBA_AVAILABLE and all(b is not None and b.shape == nir.shape for b in all_bands):
+        kernel = _get_fused_kernel()
+        if kernel is not None:
+            return _compute_vegetation_indices_fused(kernel, *all_bands)
+    
+    denom = None
+    
+    # NDVI = (NIR - Red) / (NIR + Red)
+    if nir is not None and red is not None:
+        ndvi = np.empty_like(nir)
+        denom = np.empty_like(nir)
+        np.subtract(nir, red, out=ndvi)
+        np.add(nir, red, out=denom)
+        denom += 1e-8
+        np.divide(ndvi, denom, out=ndvi)
+        np.clip(ndvi, -1, 1, out=ndvi)
+        indices['NDVI'] = ndvi
+    
+    # NDRE = (NIR - Red Edge) / (NIR + Red Edge)
+    if nir is not None and red_edge is not None:
+        ndre = np.empty_like(nir)
+        if denom is None:
+            denom = np.empty_like(nir)
+        np.subtract(nir, red_edge, out=ndre)
+        np.add(nir, red_edge, out=denom)
+        denom += 1e-8
+        np.divide(ndre, denom, out=ndre)
+        np.clip(ndre, -1, 1, out=ndre)
+        indices['NDRE'] = ndre
+    
+    # EVI = 2.5 * (NIR - Red) / (NIR + 6*Red - 7.5*Blue + 1)
+    if nir is not None and red is not None and blue is not None:
+        evi = np.empty_like(nir)
+        if NUMEXPR_AVAILABLE:
+            # Write into the dtype buffer; numexpr would otherwise upcast to float64
+            ne.evaluate("2.5 * (nir - red) / (nir + 6*red - 7.5*blue + 1)",
+                        out=evi, casting='same_kind')
+        else:
+            # evi doubles as scratch for 7.5*Blue before holding the numerator
+            np.multiply(blue, 7.5, out=evi)
+            np.multiply(red, 6, out=denom)
+            denom -= evi
+            denom += nir
+            denom += 1
+            np.subtract(nir, red, out=evi)
+            evi *= 2.5
+            np.divide(evi, denom, out=evi)
+        np.clip(evi, -1, 1, out=evi)
+        indices['EVI'] = evi
+    
+    return indices
+
+def generate_recommendations(growth_stage, nitrogen_level):
+    """Generate irrigation and fertilizer recommendations"""
+    recommendations = {
+        'growth_stage': growth_stage,
+        'nitrogen_level': nitrogen_level,
+        'nitrogen_status': 'low' if nitrogen_level < NUTRIENT_THRESHOLDS['nitrogen_low'] else 
+                          'medium' if nitrogen_level < NUTRIENT_THRESHOLDS['nitrogen_medium'] else 'high',
+        'recommendations': {}
+    }
+    
+    # Stage-specific recommendations
+    stage_recs = STAGE_RECOMMENDATIONS.get(growth_stage)
+    if stage_recs is not None:
+        n_deficit = max(0, stage_recs['fertilizer_N_target'] - nitrogen_level)
+        recommendations['recommendations'] = {
+            'irrigation': stage_recs['irrigation'],
+            'fertilizer': stage_recs['fertilizer'].format(n_deficit=n_deficit),
+            'management': stage_recs['management']
+        }
+    
+    return recommendations
+
+@app.route('/')
+def home():
+    """Home page with API documentation"""
+    return cached_page_response(_HOME_PAGES[_GEE_OK], _HOME_ETAGS[_GEE_OK])
+
+@app.route('/predict-gee', methods=['POST'])
+def predict_gee():
+    """Predict using Google Earth Engine data (supports lat/lon AOI)"""
+    if not _GEE_OK:
+        return jsonify({'error': 'GEE integration not available'}), 400
+    
+    try:
+        data = request.get_json() or {}
+        use_gee = data.get('use_gee', True)
+        
+        if not use_gee:
+            return jsonify({'error': 'GEE prediction requested but use_gee is False'}), 400
+        
+        # Optional AOI coordinates; unparseable values fall back to no AOI
+        coords = None
+        lat = data.get('lat')
+        lon = data.get('lon')
+        if lat is not None and lon is not None:
+            try:
+                coords = (float(lat), float(lon))
+            except (TypeError, ValueError):
+                coords = None
+            if coords is not None and not all(math.isfinite(c) for c in coords):
+                return jsonify({'error': 'lat and lon must be finite numbers'}), 400
+        
+        week = datetime.now(timezone.utc).strftime('%G-%V')
+        if coords is not None:
+            cache_key = (round(coords[0], 2), round(coords[1], 2), week)
+        else:
+            cache_key = (None, None, week)
+        
+        with _gee_cache_lock:
+            cached = _gee_cache.get(cache_key)
+        
+        if cached is not None:
+            summary, growth_stage, nitrogen_level = cached
+        else:
+            # Optional AOI from lat/lon (1km buffer) when in Live mode
+            aoi = None
+            if coords is not None:
+                try:
+                    import ee
+                    aoi = ee.Geometry.Point([coords[1], coords[0]]).buffer(1000)
+                except Exception:
+                    aoi = None
+            
+            # Get GEE data (Live if available, Demo otherwise)
+            gee_image = gee_integration.get_weekly_sentinel2_data(aoi=aoi)
+            
+            # Get summary statistics
+            summary = gee_integration.get_weekly_summary(gee_image)
+            
+            # Generate predictions based on NDVI
+            ndvi_mean = summary['ndvi_mean']
+            
+            # Predict growth stage based on NDVI
+            growth_stage = GROWTH_STAGES[int(np.searchsorted(NDVI_STAGE_CUTS, ndvi_mean, side='right'))]
+            
+            # Predict nitrogen level
+            nitrogen_level = 80 + (ndvi_mean * 100) + _get_rng().normal(0.0, 10.0)
+            nitrogen_level = 40.0 if nitrogen_level < 40.0 else (200.0 if nitrogen_level > 200.0 else nitrogen_level)
+            
+            # GEE calls run outside the lock; concurrent misses on the same
+            # cell just race to store equivalent results
+            with _gee_cache_lock:
+                _gee_cache[cache_key] = (summary, growth_stage, nitrogen_level)
+        
+        ndvi_mean = summary['ndvi_mean']
+        
+        # Generate recommendations
+        recommendations = generate_recommendations(growth_stage, nitrogen_level)
+        
+        return jsonify({
+            'success': True,
+            'predictions': {
+                'growth_stage': growth_stage,
+                'nitrogen_level': nitrogen_level,
+                'ndvi_mean': ndvi_mean
+            },
+            'recommendations': recommendations,
+            'timestamp': _iso_now(),
+            'data_source': 'Google Earth Engine',
+            'gee_summary': summary
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in predict_gee: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/cache/clear', methods=['POST'])
+def clear_cache():
+    """Invalidate cached GEE predictions (admin only)
+
+    Requires the CACHE_ADMIN_TOKEN env var to be set and sent back in the
+    X-Admin-Token header. Each gunicorn worker holds its own cache, so this
+    only clears the worker that serves the request.
+    """
+    admin_token = os.environ.get('CACHE_ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({'error': 'Cache administration is disabled'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    
+    with _gee_cache_lock:
+        cleared = len(_gee_cache)
+        _gee_cache.clear()
+    
+    logger.info(f"🧹 Cleared {cleared} cached GEE predictions")
+    return jsonify({
+        'success': True,
+        'cleared': cleared,
+        'timestamp': _iso_now()
+    })
+
+@app.route('/dashboard')
+def dashboard():
+    """Dashboard for officials to view aggregated data"""
+    return cached_page_response(_DASHBOARD_PAGES[_GEE_OK], _DASHBOARD_ETAGS[_GEE_OK])
+
+@app.route('/health')
+def health():
+    """Health check endpoint"""
+    return Response(_HEALTH_PREFIX + _iso_now().encode('ascii') + b'"}', mimetype='application/json')
+
+def ensure_models_loaded():
+    """Run startup loading once per process (in the gunicorn master under --preload)
+
+    Under --preload this only shares the rendered pages and the health prefix
+    with workers. The CNN loads lazily on first use, and under gunicorn GEE
+    is initialized in each worker rather than here.
+    """
+    if app.config.get('_MODELS_LOADED'):
+        return
     load_trained_models()
+    app.config['_MODELS_LOADED'] = True
     
+    # Optionally pin the current process memory so shared pages are not swapped out
+    if os.environ.get('MLOCK_MODELS') == '1':
+        try:
+            import ctypes
+            MCL_CURRENT = 1
+            if ctypes.CDLL('libc.so.6', use_errno=True).mlockall(MCL_CURRENT) != 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+            logger.info("🔒 Locked current process memory (mlockall)")
+        except Exception as e:
+            logger.warning(f"⚠️ mlockall failed: {e}")
+
+# Run startup at import (in the master under gunicorn --preload)
+if not IMPORT_ONLY:
+    ensure_models_loaded()
+
+if __name__ == '__main__':
     # Run the Flask app
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)